@@ -10,6 +10,13 @@ import json
 from datetime import datetime
 import time
 
+# The publisher packs payloads with msgpack when it is installed; fall back
+# to JSON-only parsing when it is not
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
 class MQTTSubscriberTest:
     def __init__(self):
         self.broker_host = "mqtt-proxy.ad.dicodrink.com"
@@ -57,7 +64,6 @@ class MQTTSubscriberTest:
         """Callback when message is received"""
         try:
             topic = msg.topic
-            payload = msg.payload.decode('utf-8')
             timestamp = datetime.now().strftime("%H:%M:%S")
             
             # Count messages per topic
@@ -68,10 +74,16 @@ class MQTTSubscriberTest:
             print(f"📨 [{timestamp}] Topic: {topic}")
             print(f"    Message #{self.message_count[topic]}")
             
-            # Try to parse JSON payload
+            # Sniff the payload format: JSON parses as UTF-8 text, anything
+            # that does not is tried as msgpack
             try:
-                data = json.loads(payload)
-                print(f"    📊 Parsed JSON:")
+                try:
+                    data = json.loads(msg.payload)
+                except (json.JSONDecodeError, UnicodeDecodeError):
+                    if msgpack is None:
+                        raise
+                    data = msgpack.unpackb(msg.payload, raw=False)
+                print(f"    📊 Parsed payload:")
                 
                 # Display key fields based on message type
                 if 'message_type' in data:
@@ -94,8 +106,8 @@ class MQTTSubscriberTest:
                 if 'timestamp' in data:
                     print(f"       ⏰ Timestamp: {data['timestamp']}")
                 
-            except json.JSONDecodeError:
-                print(f"    📝 Raw payload: {payload}")
+            except Exception:
+                print(f"    📝 Raw payload: {msg.payload!r}")
             
             print("    " + "-" * 50)
             
@@ -0,0 +1,42 @@
+#!/usr/bin/env python3
+
+"""
+Build script for the optional tracking_probe_ext Cython extension
+
+Compiles the native object-meta list walker used by the buffer probes.
+Requires Cython and the DeepStream SDK headers (same include path as
+nvdsinfer_custom_impl_Yolo/Makefile).
+
+Usage:
+    cd src && python3 setup_tracking_probe_ext.py build_ext --inplace
+"""
+
+import subprocess
+
+from setuptools import Extension, setup
+from Cython.Build import cythonize
+
+
+def glib_include_dirs():
+    """Resolve glib include dirs via pkg-config, with common fallbacks"""
+    try:
+        out = subprocess.run(['pkg-config', '--cflags', 'glib-2.0'],
+                             capture_output=True, text=True, timeout=10)
+        if out.returncode == 0:
+            return [flag[2:] for flag in out.stdout.split() if flag.startswith('-I')]
+    except Exception:
+        pass
+    return ['/usr/include/glib-2.0', '/usr/lib/x86_64-linux-gnu/glib-2.0/include']
+
+
+extension = Extension(
+    'tracking_probe_ext',
+    sources=['tracking_probe_ext.pyx'],
+    include_dirs=['/opt/nvidia/deepstream/deepstream/sources/includes'] + glib_include_dirs(),
+    extra_compile_args=['-O3'],
+)
+
+setup(
+    name='tracking_probe_ext',
+    ext_modules=cythonize([extension]),
+)
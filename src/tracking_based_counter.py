@@ -8,11 +8,36 @@ Counts unique objects per stream using tracker IDs instead of detection lines
 import sys
 import json
 import time
+import queue
 import threading
+from array import array
 from datetime import datetime
-from collections import defaultdict
+from collections import defaultdict, deque
 from pathlib import Path
 
+# Fast JSON serialization - orjson is a C serializer emitting bytes in a
+# single pass; fall back to a compact stdlib encoding when not installed
+try:
+    import orjson
+
+    def _json_dumps(data):
+        return orjson.dumps(data, option=orjson.OPT_INDENT_2)
+
+    def _json_payload(data):
+        return orjson.dumps(data)
+
+    def _json_line(data):
+        return orjson.dumps(data) + b'\n'
+except ImportError:
+    def _json_dumps(data):
+        return json.dumps(data, separators=(',', ':')).encode()
+
+    def _json_payload(data):
+        return json.dumps(data, separators=(',', ':')).encode()
+
+    def _json_line(data):
+        return json.dumps(data, separators=(',', ':')).encode() + b'\n'
+
 # DeepStream imports
 try:
     import gi
@@ -20,12 +45,123 @@ try:
     from gi.repository import GObject, Gst
     import pyds
     PYDS_AVAILABLE = True
+    # Prebound per-buffer accessor - avoids the module/attribute descent on
+    # the hottest call in the probe
+    _get_batch_meta = pyds.gst_buffer_get_nvds_batch_meta
+    # Module-level constants for the per-buffer probe - each enum/attribute
+    # read is a dict probe, and these run on every single buffer
+    _PROBE_OK = Gst.PadProbeReturn.OK
+    _UNTRACKED = pyds.UNTRACKED_OBJECT_ID
+    _NvDsFrameMeta_cast = pyds.NvDsFrameMeta.cast
+    _NvDsObjectMeta_cast = pyds.NvDsObjectMeta.cast
     print("✅ DeepStream Python bindings available - Tracking mode enabled")
 except Exception as e:
     PYDS_AVAILABLE = False
+    _PROBE_OK = 0
+    _UNTRACKED = None
+    _NvDsFrameMeta_cast = None
+    _NvDsObjectMeta_cast = None
     print(f"⚠️  DeepStream Python bindings not available: {e}")
     print("📝 Running in simulation mode for testing")
 
+# Reader-writer lock for the shared counters - reads (payload building,
+# overlay stats) vastly outnumber writes (new-ID insertion). Falls back to a
+# single re-entrant lock when the readerwriterlock package is not installed
+try:
+    from readerwriterlock import rwlock
+
+    def _make_rwlock():
+        return rwlock.RWLockFair()
+except ImportError:
+    class _FallbackRWLock:
+        """Single-RLock stand-in exposing the RWLockFair interface"""
+
+        def __init__(self):
+            self._lock = threading.RLock()
+
+        def gen_rlock(self):
+            return self._lock
+
+        def gen_wlock(self):
+            return self._lock
+
+    def _make_rwlock():
+        return _FallbackRWLock()
+
+
+# Compact int64 hash sets for the per-stream tracked IDs - khash-backed
+# storage costs ~16 bytes/slot versus ~100 for boxed ints in a Python set
+# and probes single cache lines; plain set is the fallback
+try:
+    from cykhash import Int64Set as _Int64Set
+except ImportError:
+    _Int64Set = set
+
+
+# Seen-ID membership keyed by (stream_id << 48) | object_id. Roaring bitmaps
+# answer int membership in a few cache lines; plain set is the fallback
+try:
+    from pyroaring import BitMap64 as _IdKeySet
+except ImportError:
+    _IdKeySet = set
+
+
+# Bloom filter parameters for the new-ID fast path: 1 MiB of bits per
+# stream, two bit positions per tracker ID from multiplicative hashing
+_BLOOM_BYTES = 1 << 17
+
+
+def _bloom_indices(object_id):
+    """Two independent 20-bit positions for a tracker ID"""
+    h1 = (object_id * 0x9E3779B97F4A7C15) & 0xFFFFFFFFFFFFFFFF
+    h2 = (object_id * 0xC2B2AE3D27D4EB4F) & 0xFFFFFFFFFFFFFFFF
+    return h1 >> 44, h2 >> 44
+
+
+# Optional Numba-compiled Bloom kernel for the native-extension path: scans a
+# frame's collected IDs against the Bloom bits in machine code with the GIL
+# released, writing 0 (definitely new, bits now set) or 1 (needs the seen-set
+# check) per entry. The interpreted _is_new_id path keeps identical semantics.
+try:
+    import numpy as _np
+    from numba import njit as _njit
+
+    @_njit(nogil=True, cache=True)
+    def _bloom_kernel(ids, n, stream_id, bloom, status):
+        one = _np.uint64(1)
+        seven = _np.uint64(7)
+        three = _np.uint64(3)
+        for i in range(n):
+            key = (_np.uint64(stream_id) << _np.uint64(48)) | _np.uint64(ids[i])
+            i1 = (key * _np.uint64(0x9E3779B97F4A7C15)) >> _np.uint64(44)
+            i2 = (key * _np.uint64(0xC2B2AE3D27D4EB4F)) >> _np.uint64(44)
+            b1 = i1 >> three
+            b2 = i2 >> three
+            m1 = one << (i1 & seven)
+            m2 = one << (i2 & seven)
+            if (bloom[b1] & m1) != 0 and (bloom[b2] & m2) != 0:
+                status[i] = 1
+            else:
+                bloom[b1] |= m1
+                bloom[b2] |= m2
+                status[i] = 0
+
+    NUMBA_AVAILABLE = True
+except ImportError:
+    _np = None
+    _bloom_kernel = None
+    NUMBA_AVAILABLE = False
+
+
+# Optional native probe accelerator (see setup_tracking_probe_ext.py)
+try:
+    import tracking_probe_ext
+    PROBE_EXT_AVAILABLE = True
+    print("⚡ Native probe extension available - C-level object-meta walk enabled")
+except ImportError:
+    tracking_probe_ext = None
+    PROBE_EXT_AVAILABLE = False
+
 
 class TrackingBasedCounter:
     def __init__(self, config_file_path=None, persistence_file="data/persistence/tracking_counts.json"):
@@ -33,27 +169,114 @@ class TrackingBasedCounter:
         self.persistence_file = Path(persistence_file)
         
         # Track unique object IDs per stream
-        self.tracked_objects = defaultdict(set)  # {stream_id: {object_id1, object_id2, ...}}
+        self.tracked_objects = defaultdict(_Int64Set)  # {stream_id: {object_id1, ...}}
+
+        # Per-stream Bloom filters guarding the new-ID path: a Bloom-negative
+        # proves the ID was never counted, so only Bloom-positives fall
+        # through to the authoritative seen-key lookup
+        self._bloom = defaultdict(lambda: bytearray(_BLOOM_BYTES))
+
+        # Authoritative dedup membership - one interned integer key per
+        # (stream, object) pair instead of a dict-of-set probe
+        self.seen = _IdKeySet()
         self.stream_totals = defaultdict(int)     # {stream_id: total_count}
         self.session_counts = defaultdict(int)    # {stream_id: session_count}
-        
-        # Performance metrics
+        self.unique_counts = defaultdict(int)     # {stream_id: len of tracked set}
+
+        # Performance metrics - frame totals plus a sliding window of recent
+        # frame timestamps per stream so the overlay shows current FPS rather
+        # than the since-start average
         self.frame_count = defaultdict(int)
-        self.fps_start_time = time.time()
+        self.fps_window = defaultdict(lambda: deque(maxlen=64))
         
-        # Thread safety
-        self.lock = threading.Lock()
+        # Thread safety - shared (read) side for payload/overlay consumers,
+        # exclusive (write) side for new-ID insertion
+        self.lock = _make_rwlock()
+
+        # Set on shutdown so waiting loops wake immediately instead of
+        # finishing out a fixed sleep
+        self.shutdown_event = threading.Event()
+
+        # Background persistence: new-ID events are queued here and appended
+        # to a JSONL delta file off the probe thread; the main JSON file is
+        # only compacted at cleanup
+        self._persist_q = queue.Queue()
+        self._delta_file = self.persistence_file.with_suffix('.jsonl')
+        self._persist_thread = threading.Thread(target=self._persist_loop, daemon=True)
+        self._persist_thread.start()
+
+        # New-object announcements go through a bounded ring buffer drained
+        # by a background thread, so the probe never blocks on stdout
+        self._log_q = deque(maxlen=1024)
+        self._log_event = threading.Event()
+        self._log_thread = threading.Thread(target=self._log_loop, daemon=True)
+        self._log_thread.start()
+
+        # Cached overlay strings - {stream_id: ((session, total), text)} so the
+        # f-string is only rebuilt when the counters actually change
+        self._overlay_cache = {}
+
+        # Constant overlay text/positions per stream - titles, panel offsets
+        # and status lines never change, so they are built exactly once
+        self._overlay_const = {
+            0: {'title': "🎥 Camera 1 (102) - TRACKING MODE", 'x': 50,
+                'status': "🟢 TRACKING STREAM 1"},
+            1: {'title': "🎥 Camera 2 (103) - TRACKING MODE", 'x': 980,
+                'status': "🟢 TRACKING STREAM 2"},
+        }
         
         # Pipeline components
         self.pipeline = None
         self.loop = None
+
+        # Resolve pyds availability once - without the bindings the overlay is
+        # a no-op, so bind it here rather than branching on every frame
+        if not PYDS_AVAILABLE:
+            self.add_tracking_overlay = self._overlay_noop
+
+        # Scratch buffers for the native probe extension (one frame's worth of
+        # object IDs / class IDs), plus the raw-pointer helper it needs, which
+        # only some pyds releases expose
+        self._frame_meta_ptr = getattr(pyds, 'get_ptr', None) if PYDS_AVAILABLE else None
+        if PROBE_EXT_AVAILABLE:
+            self._ext_ids = array('q', [0] * 1024)
+            self._ext_classes = array('i', [0] * 1024)
+            if NUMBA_AVAILABLE:
+                # Zero-copy views for the Numba kernel: the ID view aliases the
+                # extension's output buffer, the per-stream Bloom views alias
+                # the bytearrays so bit writes are shared with _is_new_id
+                self._ext_ids_np = _np.frombuffer(self._ext_ids, dtype=_np.int64)
+                self._ext_status = _np.empty(len(self._ext_ids), dtype=_np.uint8)
+                self._bloom_np = {}
         
+        # LRU bookkeeping bounding the dedup structures on long runs: tracker
+        # IDs live for seconds, so membership entries idle for a whole
+        # horizon of frames get evicted. Published counts are untouched
+        self._last_seen = {}        # {(stream_id << 48) | object_id: frame tick}
+        self._frame_tick = 0
+        self._evict_horizon = 10000
+
+        # class_id -> class_name table loaded once from the model's label
+        # file, so the hot path can intern names by integer instead of
+        # decoding obj_meta.obj_label per new object
+        self._classes = self._load_class_labels()
+
         print("🎯 Tracking-Based Object Counter initialized")
         print("📊 Method: Unique tracker IDs instead of detection lines")
         print("💾 Persistence file:", self.persistence_file)
         
         self.load_session_data()
         
+    def _load_class_labels(self):
+        """Load class names from the model label file (one name per line)"""
+        labels_file = Path(__file__).resolve().parent.parent / 'models' / 'labels.txt'
+        try:
+            with open(labels_file, 'r') as f:
+                return tuple(line.strip() for line in f if line.strip())
+        except Exception as e:
+            print(f"⚠️  Could not load class labels: {e}")
+            return ()
+
     def load_session_data(self):
         """Load session data from persistence"""
         try:
@@ -75,154 +298,367 @@ class TrackingBasedCounter:
             # Ensure directory exists
             self.persistence_file.parent.mkdir(parents=True, exist_ok=True)
             
+            # One timestamp per save - it is identical for every stream entry
+            now_iso = datetime.now().isoformat()
+
             data = {}
             for stream_id in self.stream_totals:
                 data[str(stream_id)] = {
                     'total_count': self.stream_totals[stream_id],
                     'session_count': self.session_counts[stream_id],
-                    'last_updated': datetime.now().isoformat(),
+                    'last_updated': now_iso,
                     'unique_objects_this_session': len(self.tracked_objects[stream_id])
                 }
             
-            with open(self.persistence_file, 'w') as f:
-                json.dump(data, f, indent=2)
-                
+            with open(self.persistence_file, 'wb') as f:
+                f.write(_json_dumps(data))
+
         except Exception as e:
             print(f"❌ Error saving session data: {e}")
+
+    def _log_loop(self):
+        """Drain queued new-object announcements to stdout off the probe thread"""
+        while not self.shutdown_event.is_set():
+            self._log_event.wait(timeout=1.0)
+            self._log_event.clear()
+
+            lines = []
+            while self._log_q:
+                stream_id, object_id, class_name, session, total = self._log_q.popleft()
+                lines.append(f"🆕 New object tracked: Stream {stream_id}, ID {object_id}, Class: {class_name}")
+                lines.append(f"📊 Stream {stream_id} - Session: {session}, Total: {total}")
+            if lines:
+                sys.stdout.write("\n".join(lines) + "\n")
+
+    def _persist_loop(self):
+        """Drain queued new-ID events into the append-only delta file"""
+        delta_f = None
+        try:
+            while True:
+                event = self._persist_q.get()
+                if event is None:
+                    break
+                try:
+                    if delta_f is None:
+                        self.persistence_file.parent.mkdir(parents=True, exist_ok=True)
+                        delta_f = open(self._delta_file, 'ab')
+                    delta_f.write(_json_line(event))
+                    delta_f.flush()
+                except Exception as e:
+                    print(f"⚠️  Could not append persistence delta: {e}")
+        finally:
+            if delta_f is not None:
+                delta_f.close()
     
     def osd_sink_pad_buffer_probe(self, pad, info, u_data):
         """Buffer probe to process tracked objects from NVIDIA Analytics"""
         if not PYDS_AVAILABLE:
-            return Gst.PadProbeReturn.OK
+            return _PROBE_OK
         
         try:
             gst_buffer = info.get_buffer()
             if not gst_buffer:
-                return Gst.PadProbeReturn.OK
+                return _PROBE_OK
             
-            # Get metadata from buffer
-            batch_meta = pyds.gst_buffer_get_nvds_batch_meta(hash(gst_buffer))
+            # Get metadata from buffer - hash() is the binding's handle for
+            # the GstBuffer address, taken once per buffer
+            batch_meta = _get_batch_meta(hash(gst_buffer))
             if not batch_meta:
-                return Gst.PadProbeReturn.OK
+                return _PROBE_OK
             
+            # Plain None-checked walk - no per-element exception handling,
+            # the pyds lists terminate with next == None
             l_frame = batch_meta.frame_meta_list
+            first_frame_meta = None
             while l_frame is not None:
-                try:
-                    frame_meta = pyds.NvDsFrameMeta.cast(l_frame.data)
-                    stream_id = frame_meta.source_id
-                    
-                    # Update frame count for FPS calculation
-                    self.frame_count[stream_id] += 1
-                    
-                    # Process tracked objects in this frame
-                    self.process_tracked_objects(frame_meta, stream_id)
-                    
-                    # Add display overlay
-                    self.add_tracking_overlay(frame_meta, stream_id)
-                    
-                except StopIteration:
-                    break
-                
-                try:
-                    l_frame = l_frame.next
-                except StopIteration:
-                    break
+                frame_meta = _NvDsFrameMeta_cast(l_frame.data)
+                stream_id = frame_meta.source_id
+                if first_frame_meta is None:
+                    first_frame_meta = frame_meta
+
+                # Update frame count and FPS window
+                self.frame_count[stream_id] += 1
+                self.fps_window[stream_id].append(time.monotonic())
+
+                # Process tracked objects in this frame
+                self.process_tracked_objects(frame_meta, stream_id)
+
+                l_frame = l_frame.next
+
+            # Attach the pooled display meta once per buffer: the panels
+            # already cover every known stream, so attaching them to each
+            # frame of the batch only multiplied the OSD work
+            if first_frame_meta is not None:
+                self.add_tracking_overlays(batch_meta, first_frame_meta,
+                                           sorted(self.frame_count))
         
         except Exception as e:
             print(f"❌ Error in tracking probe: {e}")
         
-        return Gst.PadProbeReturn.OK
+        return _PROBE_OK
     
     def process_tracked_objects(self, frame_meta, stream_id):
-        """Process tracked objects and count unique IDs"""
+        """Process tracked objects and count unique IDs
+
+        Returns the frame's confident tracked IDs so callers (e.g. the MQTT
+        publisher) can reuse them without a second list walk.
+        """
+        # Advance the eviction clock once per processed frame and compact the
+        # membership structures every horizon's worth of frames
+        tick = self._frame_tick + 1
+        self._frame_tick = tick
+        if tick % self._evict_horizon == 0:
+            self._compact_tracked_objects(tick)
+
+        # Skip empty frames entirely - common on low-activity streams, and
+        # avoids even touching the linked-list head when there is nothing to do
+        if getattr(frame_meta, 'num_obj_meta', None) == 0:
+            return ()
+
+        # Fast path: walk the list in C and only bring the surviving IDs back
+        # into Python
+        if PROBE_EXT_AVAILABLE and self._frame_meta_ptr is not None:
+            n = tracking_probe_ext.collect(
+                self._frame_meta_ptr(frame_meta), 0.5,
+                _UNTRACKED, self._ext_ids, self._ext_classes)
+            frame_ids = []
+            if NUMBA_AVAILABLE and n:
+                # Run the Bloom arithmetic for the whole frame in compiled
+                # code; only Bloom-positive entries fall back to the seen-set
+                bloom_view = self._bloom_np.get(stream_id)
+                if bloom_view is None:
+                    bloom_view = _np.frombuffer(self._bloom[stream_id],
+                                                dtype=_np.uint8)
+                    self._bloom_np[stream_id] = bloom_view
+                _bloom_kernel(self._ext_ids_np, n, stream_id, bloom_view,
+                              self._ext_status)
+                seen = self.seen
+                status = self._ext_status
+                classes = self._classes
+                n_classes = len(classes)
+                last_seen = self._last_seen
+                for i in range(n):
+                    object_id = self._ext_ids[i]
+                    frame_ids.append(object_id)
+                    key = (stream_id << 48) | object_id
+                    last_seen[key] = tick
+                    if status[i] == 0 or key not in seen:
+                        seen.add(key)
+                        class_id = self._ext_classes[i]
+                        class_name = classes[class_id] if class_id < n_classes else "object"
+                        self._register_new_object(stream_id, object_id, class_name)
+                return frame_ids
+            classes = self._classes
+            n_classes = len(classes)
+            for i in range(n):
+                object_id = self._ext_ids[i]
+                frame_ids.append(object_id)
+                if self._is_new_id(stream_id, object_id):
+                    class_id = self._ext_classes[i]
+                    class_name = classes[class_id] if class_id < n_classes else "object"
+                    self._register_new_object(stream_id, object_id, class_name)
+            last_seen = self._last_seen
+            base = stream_id << 48
+            for object_id in frame_ids:
+                last_seen[base | object_id] = tick
+            return frame_ids
+
+        # Python fallback walk - prebind the hot lookups as locals so the
+        # per-object loop body runs on fast local loads
+        cast = _NvDsObjectMeta_cast
+        untracked_id = _UNTRACKED
+        is_new_id = self._is_new_id
+        register = self._register_new_object
+        classes = self._classes
+        n_classes = len(classes)
+
         l_obj = frame_meta.obj_meta_list
         current_frame_objects = set()
-        
+
         while l_obj is not None:
-            try:
-                obj_meta = pyds.NvDsObjectMeta.cast(l_obj.data)
-                
-                # Check if object has valid tracking ID and meets confidence threshold
-                if (obj_meta.object_id != pyds.UNTRACKED_OBJECT_ID and 
-                    obj_meta.confidence > 0.5):  # Confidence threshold
-                    
-                    object_key = f"{stream_id}_{obj_meta.object_id}"
-                    current_frame_objects.add(obj_meta.object_id)
-                    
-                    # If this is a new unique object for this stream
-                    if obj_meta.object_id not in self.tracked_objects[stream_id]:
-                        with self.lock:
-                            self.tracked_objects[stream_id].add(obj_meta.object_id)
-                            self.session_counts[stream_id] += 1
-                            self.stream_totals[stream_id] += 1
-                            
-                            # Update persistent counter
-                            class_name = obj_meta.obj_label if obj_meta.obj_label else "object"
-                            self.counter.increment_count(stream_id, class_name)
-                            
-                            print(f"🆕 New object tracked: Stream {stream_id}, ID {obj_meta.object_id}, Class: {class_name}")
-                            print(f"📊 Stream {stream_id} - Session: {self.session_counts[stream_id]}, Total: {self.stream_totals[stream_id]}")
-            
-            except StopIteration:
-                break
-            
-            try:
-                l_obj = l_obj.next
-            except StopIteration:
-                break
+            obj_meta = cast(l_obj.data)
+            object_id = obj_meta.object_id
+
+            # Check if object has valid tracking ID and meets confidence threshold
+            if object_id != untracked_id and obj_meta.confidence > 0.5:
+                current_frame_objects.add(object_id)
+
+                # If this is a new unique object for this stream
+                if is_new_id(stream_id, object_id):
+                    # Intern the name by integer class_id - avoids the
+                    # obj_label C-string -> PyUnicode copy per new object
+                    class_id = obj_meta.class_id
+                    class_name = classes[class_id] if class_id < n_classes else "object"
+                    register(stream_id, object_id, class_name)
+
+            l_obj = l_obj.next
+
+        last_seen = self._last_seen
+        base = stream_id << 48
+        for object_id in current_frame_objects:
+            last_seen[base | object_id] = tick
+
+        return current_frame_objects
+
+    def _compact_tracked_objects(self, tick):
+        """Evict dedup entries idle for longer than the eviction horizon
+
+        Trims self.seen, the per-stream tracked sets, unique_counts and the
+        last-seen map, then re-seeds the Bloom filters from the survivors
+        (Bloom bits cannot be deleted individually). stream_totals /
+        session_counts are lifetime counts, not membership, and are
+        deliberately left alone.
+        """
+        cutoff = tick - self._evict_horizon
+        last_seen = self._last_seen
+        stale = [key for key, seen_at in last_seen.items() if seen_at < cutoff]
+        if not stale:
+            return
+
+        with self.lock.gen_wlock():
+            for key in stale:
+                del last_seen[key]
+                self.seen.discard(key)
+                stream_id = key >> 48
+                if (key & 0xFFFFFFFFFFFF) in self.tracked_objects[stream_id]:
+                    self.tracked_objects[stream_id].discard(key & 0xFFFFFFFFFFFF)
+                    # Keep unique_counts in lockstep with the tracked sets -
+                    # the overlay reads the counter, the MQTT payload reads
+                    # the set size, and they report the same metric
+                    self.unique_counts[stream_id] -= 1
+
+            # Zero the Bloom bits in place (keeps any NumPy views aliased to
+            # the bytearrays valid) and re-insert the surviving keys
+            empty = bytes(_BLOOM_BYTES)
+            for bloom in self._bloom.values():
+                bloom[:] = empty
+            for key in self.seen:
+                bloom = self._bloom[key >> 48]
+                i1, i2 = _bloom_indices(key)
+                bloom[i1 >> 3] |= 1 << (i1 & 7)
+                bloom[i2 >> 3] |= 1 << (i2 & 7)
+
+        print(f"🧹 Evicted {len(stale)} stale tracker IDs (tick {tick})")
+
+    def _is_new_id(self, stream_id, object_id):
+        """Bloom-guarded new-ID test; marks the ID as seen when it is new"""
+        key = (stream_id << 48) | object_id
+        bloom = self._bloom[stream_id]
+        i1, i2 = _bloom_indices(key)
+        if (bloom[i1 >> 3] & (1 << (i1 & 7))) and (bloom[i2 >> 3] & (1 << (i2 & 7))):
+            # Possibly seen - confirm against the key set (Bloom false positives)
+            if key in self.seen:
+                return False
+        bloom[i1 >> 3] |= 1 << (i1 & 7)
+        bloom[i2 >> 3] |= 1 << (i2 & 7)
+        self.seen.add(key)
+        return True
+
+    def _register_new_object(self, stream_id, object_id, class_name):
+        """Record a newly tracked unique object for a stream"""
+        with self.lock.gen_wlock():
+            self.tracked_objects[stream_id].add(object_id)
+            self.unique_counts[stream_id] += 1
+            self.session_counts[stream_id] += 1
+            self.stream_totals[stream_id] += 1
+
+            # Update the external persistent counter when one is attached
+            counter = getattr(self, 'counter', None)
+            if counter is not None:
+                counter.increment_count(stream_id, class_name)
+
+            # Announce off the hot path - the drain thread does the printing
+            self._log_q.append((stream_id, object_id, class_name,
+                                self.session_counts[stream_id],
+                                self.stream_totals[stream_id]))
+            self._log_event.set()
+
+        # Queue the event for the background persistence writer
+        self._persist_q.put({
+            'stream_id': stream_id,
+            'object_id': object_id,
+            'class': class_name,
+            'timestamp': time.time()
+        })
     
+    def _overlay_noop(self, frame_meta, stream_id):
+        """Overlay stand-in used when the DeepStream bindings are unavailable"""
+        return
+
     def add_tracking_overlay(self, frame_meta, stream_id):
-        """Add tracking-based count overlay to the display"""
+        """Add tracking-based count overlay for a single stream"""
+        self.add_tracking_overlays(frame_meta.base_meta.batch_meta, frame_meta, (stream_id,))
+
+    def add_tracking_overlays(self, batch_meta, frame_meta, stream_ids):
+        """Add count overlays for all streams with one pooled display meta
+
+        A display meta carries up to 16 text params, so both camera panels
+        (5 labels each) fit in a single pool acquisition and a single
+        add-to-frame call instead of one per stream.
+        """
         try:
-            # Calculate current FPS
-            current_time = time.time()
-            elapsed = current_time - self.fps_start_time
-            fps = self.frame_count[stream_id] / elapsed if elapsed > 0 else 0
-            
-            # Get current counts
-            unique_objects_current = len(self.tracked_objects[stream_id])
-            session_count = self.session_counts[stream_id]
-            total_count = self.stream_totals[stream_id]
-            
-            # Create display metadata
+            # Create display metadata (shared by every stream panel)
             display_meta = pyds.nvds_acquire_display_meta_from_pool(batch_meta)
-            if display_meta:
-                # Position based on stream ID (side by side for 2 cameras)
-                if stream_id == 0:
-                    x_offset = 50
-                    title = "🎥 Camera 1 (102) - TRACKING MODE"
+            if not display_meta:
+                return
+
+            for stream_id in stream_ids:
+                # Current FPS over the recent frame window
+                window = self.fps_window[stream_id]
+                if len(window) > 1 and window[-1] > window[0]:
+                    fps = (len(window) - 1) / (window[-1] - window[0])
                 else:
-                    x_offset = 980  # Right side for second camera
-                    title = "🎥 Camera 2 (103) - TRACKING MODE"
-                
+                    fps = 0.0
+
+                # Get current counts - plain int reads, no set sizing
+                unique_objects_current = self.unique_counts[stream_id]
+                session_count = self.session_counts[stream_id]
+                total_count = self.stream_totals[stream_id]
+
+                # Constant panel text/position (side by side for 2 cameras)
+                const = self._overlay_const.get(stream_id)
+                if const is None:
+                    const = {'title': f"🎥 Camera {stream_id + 1} - TRACKING MODE",
+                             'x': 50 + 930 * stream_id,
+                             'status': f"🟢 TRACKING STREAM {stream_id + 1}"}
+                    self._overlay_const[stream_id] = const
+                x_offset = const['x']
+
                 y_start = 50
-                
+
                 # Title
-                self.add_text_overlay(display_meta, title, x_offset, y_start, 
+                self.add_text_overlay(display_meta, const['title'], x_offset, y_start,
                                     font_size=16, font_color=(1.0, 1.0, 0.0, 1.0))  # Yellow
-                
+
                 # Unique objects currently visible
-                self.add_text_overlay(display_meta, f"🔢 UNIQUE OBJECTS: {unique_objects_current}", 
-                                    x_offset, y_start + 30, font_size=18, 
+                self.add_text_overlay(display_meta, f"🔢 UNIQUE OBJECTS: {unique_objects_current}",
+                                    x_offset, y_start + 30, font_size=18,
                                     font_color=(0.0, 1.0, 1.0, 1.0))  # Cyan
-                
-                # Session and total counts
-                self.add_text_overlay(display_meta, f"📊 Session: {session_count} | Total: {total_count}", 
-                                    x_offset, y_start + 60, font_size=14, 
+
+                # Session and total counts - reuse the cached string while the
+                # counters are stable (typical between new-object events)
+                cache_key = (session_count, total_count)
+                cached = self._overlay_cache.get(stream_id)
+                if cached is not None and cached[0] == cache_key:
+                    session_total_text = cached[1]
+                else:
+                    session_total_text = f"📊 Session: {session_count} | Total: {total_count}"
+                    self._overlay_cache[stream_id] = (cache_key, session_total_text)
+                self.add_text_overlay(display_meta, session_total_text,
+                                    x_offset, y_start + 60, font_size=14,
                                     font_color=(1.0, 0.8, 0.0, 1.0))  # Orange
-                
+
                 # FPS and method
-                self.add_text_overlay(display_meta, f"⚡ FPS: {fps:.1f} | 🎯 Tracker IDs", 
-                                    x_offset, y_start + 90, font_size=12, 
+                self.add_text_overlay(display_meta, f"⚡ FPS: {fps:.1f} | 🎯 Tracker IDs",
+                                    x_offset, y_start + 90, font_size=12,
                                     font_color=(0.7, 0.7, 0.7, 1.0))  # Gray
-                
+
                 # Status indicator
-                status = f"🟢 TRACKING STREAM {stream_id + 1}"
-                self.add_text_overlay(display_meta, status, x_offset, y_start + 120, 
+                self.add_text_overlay(display_meta, const['status'], x_offset, y_start + 120,
                                     font_size=12, font_color=(0.0, 1.0, 0.0, 1.0))  # Green
-                
-                pyds.nvds_add_display_meta_to_frame(frame_meta, display_meta)
-        
+
+            pyds.nvds_add_display_meta_to_frame(frame_meta, display_meta)
+
         except Exception as e:
             print(f"❌ Error adding tracking overlay: {e}")
     
@@ -283,36 +719,44 @@ class TrackingBasedCounter:
     
     def print_statistics(self):
         """Print current tracking statistics"""
-        print("\n" + "="*60)
-        print("📊 TRACKING-BASED OBJECT COUNTING STATISTICS")
-        print("="*60)
-        
+        # Build the whole summary first and emit it with a single write so the
+        # report is one syscall instead of one per line
+        lines = ["", "="*60, "📊 TRACKING-BASED OBJECT COUNTING STATISTICS", "="*60]
+
         total_unique_objects = 0
         total_session_objects = 0
-        
+
         for stream_id in sorted(self.tracked_objects.keys()):
             unique_count = len(self.tracked_objects[stream_id])
             session_count = self.session_counts[stream_id]
             total_count = self.stream_totals[stream_id]
-            
-            print(f"🎥 Stream {stream_id}: {unique_count} unique | Session: {session_count} | Total: {total_count}")
-            
+
+            lines.append(f"🎥 Stream {stream_id}: {unique_count} unique | Session: {session_count} | Total: {total_count}")
+
             total_unique_objects += unique_count
             total_session_objects += session_count
-        
-        print(f"📈 Grand Total: {total_unique_objects} unique objects currently tracked")
-        print(f"📊 Session Total: {total_session_objects} new objects this session")
-        print("="*60)
+
+        lines.append(f"📈 Grand Total: {total_unique_objects} unique objects currently tracked")
+        lines.append(f"📊 Session Total: {total_session_objects} new objects this session")
+        lines.append("="*60)
+        sys.stdout.write("\n".join(lines) + "\n")
     
-    def generate_mqtt_payload(self, stream_id):
-        """Generate MQTT payload with tracking-based counts"""
-        with self.lock:
+    def generate_mqtt_payload(self, stream_id, now_iso=None):
+        """Generate a serialized MQTT payload with tracking-based counts
+
+        Returns JSON bytes ready for client.publish so the publisher does
+        not re-serialize. Callers producing several payloads per batch can
+        pass a shared now_iso so the timestamp is formatted once per batch.
+        """
+        if now_iso is None:
+            now_iso = datetime.now().isoformat()
+        with self.lock.gen_rlock():
             unique_objects = len(self.tracked_objects[stream_id])
             session_count = self.session_counts[stream_id]
             total_count = self.stream_totals[stream_id]
-            
-            return {
-                "timestamp": datetime.now().isoformat(),
+
+            return _json_payload({
+                "timestamp": now_iso,
                 "stream_id": stream_id,
                 "counting_method": "tracker_ids",
                 "unique_objects_tracked": unique_objects,
@@ -320,20 +764,34 @@ class TrackingBasedCounter:
                 "total_count": total_count,
                 "tracked_object_ids": list(self.tracked_objects[stream_id]),
                 "message_type": "tracking_count_update"
-            }
+            })
     
-    def get_all_counts(self):
+    def get_all_counts(self, now_iso=None):
         """Get all counts for MQTT publishing"""
-        return {
-            'session_counts': dict(self.session_counts),
-            'stream_totals': dict(self.stream_totals),
-            'timestamp': datetime.now().isoformat()
-        }
+        if now_iso is None:
+            now_iso = datetime.now().isoformat()
+        with self.lock.gen_rlock():
+            return {
+                'session_counts': dict(self.session_counts),
+                'stream_totals': dict(self.stream_totals),
+                'timestamp': now_iso
+            }
     
     def cleanup(self):
         """Cleanup resources and save data"""
         print("\n🧹 Cleaning up tracking-based counter...")
+        self.shutdown_event.set()
+
+        # Flush the background writer, compact into the main JSON file and
+        # drop this session's delta log
+        self._persist_q.put(None)
+        self._persist_thread.join(timeout=5)
         self.save_session_data()
+        try:
+            self._delta_file.unlink()
+        except OSError:
+            pass
+
         self.print_statistics()
         
         if self.pipeline:
@@ -361,9 +819,9 @@ def main():
             print("✅ Ready for DeepStream integration")
             print("📝 This module provides the probe function for tracking-based counting")
             
-            # Keep running for demonstration
-            while True:
-                time.sleep(10)
+            # Keep running for demonstration - the event wait returns early
+            # the moment shutdown is requested
+            while not counter.shutdown_event.wait(10):
                 counter.print_statistics()
         else:
             # Simulation mode for testing
@@ -382,16 +840,18 @@ def main():
                     counter.stream_totals[stream_id] += 1
                     
                     print(f"🆕 Simulated: Stream {stream_id}, Object ID {object_id}")
-                
-                time.sleep(0.5)
+
+                if counter.shutdown_event.wait(0.5):
+                    break
             
             counter.print_statistics()
             
-            # Test MQTT payload generation
+            # Test MQTT payload generation - one shared timestamp per batch
+            now_iso = datetime.now().isoformat()
             for stream_id in [0, 1]:
-                payload = counter.generate_mqtt_payload(stream_id)
+                payload = counter.generate_mqtt_payload(stream_id, now_iso)
                 print(f"\n📡 MQTT Payload for Stream {stream_id}:")
-                print(json.dumps(payload, indent=2))
+                print(payload.decode())
     
     except KeyboardInterrupt:
         print("\n🛑 Interrupted by user")
@@ -10,6 +10,7 @@ import signal
 import threading
 import time
 import os
+from array import array
 from pathlib import Path
 
 # Import our custom modules
@@ -22,14 +23,42 @@ from tracking_based_counter import TrackingBasedCounter
 try:
     import gi
     gi.require_version('Gst', '1.0')
-    from gi.repository import GObject, Gst
+    from gi.repository import GObject, Gst, GLib
     import pyds
     PYDS_AVAILABLE = True
+    # Prebound per-buffer accessor - avoids the module/attribute descent on
+    # the hottest call in the probe
+    _get_batch_meta = pyds.gst_buffer_get_nvds_batch_meta
+    # Module-level constants for the per-buffer probe - each enum/attribute
+    # read is a dict probe, and these run on every single buffer
+    _PROBE_OK = Gst.PadProbeReturn.OK
+    _UNTRACKED = pyds.UNTRACKED_OBJECT_ID
+    _NvDsFrameMeta_cast = pyds.NvDsFrameMeta.cast
     print("✅ DeepStream Python bindings available")
 except Exception as e:
     PYDS_AVAILABLE = False
+    _PROBE_OK = 0
+    _UNTRACKED = None
+    _NvDsFrameMeta_cast = None
     print(f"⚠️  DeepStream Python bindings not available: {e}")
 
+# Optional native probe accelerator (see setup_tracking_probe_ext.py)
+try:
+    import tracking_probe_ext
+    PROBE_EXT_AVAILABLE = True
+    print("⚡ Native probe extension available - C-level batch walk enabled")
+except ImportError:
+    tracking_probe_ext = None
+    PROBE_EXT_AVAILABLE = False
+
+# Optional NumPy for vectorized grouping of the batch scratch buffers
+try:
+    import numpy as np
+    NUMPY_AVAILABLE = True
+except ImportError:
+    np = None
+    NUMPY_AVAILABLE = False
+
 # Global variables for graceful shutdown
 running = True
 mqtt_publisher = None
@@ -66,6 +95,19 @@ class TrackingDeepStreamApp:
         # Initialize tracking-based components
         self.mqtt_publisher = TrackingMQTTPublisher()
         self.tracking_counter = TrackingBasedCounter(config_path)
+
+        # SoA scratch buffers for the native batch walk (object IDs and their
+        # source stream IDs), reused across frames, plus the raw-pointer
+        # helper the extension needs. NumPy-backed when available so the
+        # per-stream grouping is vectorized instead of per-element Python
+        self._batch_meta_ptr = getattr(pyds, 'get_ptr', None) if PYDS_AVAILABLE else None
+        if PROBE_EXT_AVAILABLE:
+            if NUMPY_AVAILABLE:
+                self._scratch_ids = np.empty(4096, dtype=np.int64)
+                self._scratch_sids = np.empty(4096, dtype=np.int32)
+            else:
+                self._scratch_ids = array('q', [0] * 4096)
+                self._scratch_sids = array('i', [0] * 4096)
         
     def bus_call(self, bus, message, loop):
         """Callback for GStreamer bus messages"""
@@ -85,101 +127,245 @@ class TrackingDeepStreamApp:
     def osd_sink_pad_buffer_probe(self, pad, info, u_data):
         """Enhanced buffer probe for tracking-based counting"""
         if not PYDS_AVAILABLE:
-            return Gst.PadProbeReturn.OK
+            return _PROBE_OK
         
         try:
             gst_buffer = info.get_buffer()
             if not gst_buffer:
-                return Gst.PadProbeReturn.OK
+                return _PROBE_OK
             
-            # Get metadata from buffer
-            batch_meta = pyds.gst_buffer_get_nvds_batch_meta(hash(gst_buffer))
+            # Get metadata from buffer - hash() is the binding's handle for
+            # the GstBuffer address, taken once per buffer
+            batch_meta = _get_batch_meta(hash(gst_buffer))
             if not batch_meta:
-                return Gst.PadProbeReturn.OK
+                return _PROBE_OK
             
+            # Publisher-only fast path: one C walk of the whole batch. When
+            # the counter is active the per-frame loop below runs instead -
+            # process_tracked_objects has its own ext-accelerated walk and
+            # has to see every frame to register new IDs
+            if (PROBE_EXT_AVAILABLE and self._batch_meta_ptr is not None
+                    and not self.tracking_counter):
+                n = tracking_probe_ext.collect_batch(
+                    self._batch_meta_ptr(batch_meta), 0.5,
+                    _UNTRACKED, self._scratch_ids, self._scratch_sids)
+
+                if self.mqtt_publisher:
+                    # Group per stream, then hand the whole batch over in a
+                    # single call so the publisher locks once per buffer
+                    per_stream = {}
+                    if NUMPY_AVAILABLE:
+                        # Vectorized grouping over the SoA views - no
+                        # per-object Python loop
+                        ids = self._scratch_ids[:n]
+                        sids = self._scratch_sids[:n]
+                        for sid in np.unique(sids):
+                            # tolist() hands over plain Python ints - numpy
+                            # scalars would poison the publisher's frozensets
+                            # and fail msgpack/orjson serialization later
+                            per_stream[int(sid)] = ids[sids == sid].tolist()
+                    else:
+                        for i in range(n):
+                            per_stream.setdefault(self._scratch_sids[i], []).append(self._scratch_ids[i])
+                    self.mqtt_publisher.update_batch(per_stream)
+
+                return _PROBE_OK
+
+            # Single-pass path: the counter walks the object list once
+            # (ext-accelerated internally when compiled), counts new IDs and
+            # hands back the frame's tracked IDs for the publisher - no
+            # duplicate traversal in this probe
             l_frame = batch_meta.frame_meta_list
+            batch_updates = {}
             while l_frame is not None:
-                try:
-                    frame_meta = pyds.NvDsFrameMeta.cast(l_frame.data)
-                    stream_id = frame_meta.source_id
-                    
-                    # Collect tracked object IDs for this frame
-                    tracked_object_ids = []
-                    l_obj = frame_meta.obj_meta_list
-                    
-                    while l_obj is not None:
-                        try:
-                            obj_meta = pyds.NvDsObjectMeta.cast(l_obj.data)
-                            
-                            # Only count objects with valid tracking IDs and good confidence
-                            if (obj_meta.object_id != pyds.UNTRACKED_OBJECT_ID and 
-                                obj_meta.confidence > 0.5):
-                                tracked_object_ids.append(obj_meta.object_id)
-                        
-                        except StopIteration:
-                            break
-                        
-                        try:
-                            l_obj = l_obj.next
-                        except StopIteration:
-                            break
-                    
-                    # Update MQTT publisher with tracked objects
-                    if self.mqtt_publisher:
-                        self.mqtt_publisher.update_tracked_objects(stream_id, tracked_object_ids)
-                    
-                    # Add tracking overlay using the counter
-                    if self.tracking_counter:
-                        self.tracking_counter.add_tracking_overlay(frame_meta, stream_id)
-                
-                except StopIteration:
-                    break
-                
-                try:
-                    l_frame = l_frame.next
-                except StopIteration:
-                    break
+                frame_meta = _NvDsFrameMeta_cast(l_frame.data)
+                stream_id = frame_meta.source_id
+
+                if self.tracking_counter:
+                    batch_updates[stream_id] = self.tracking_counter.process_tracked_objects(
+                        frame_meta, stream_id)
+                    self.tracking_counter.add_tracking_overlay(frame_meta, stream_id)
+
+                l_frame = l_frame.next
+
+            # One publisher update for the whole batch - single lock acquire
+            # instead of one per stream
+            if self.mqtt_publisher and batch_updates:
+                self.mqtt_publisher.update_batch(batch_updates)
         
         except Exception as e:
             print(f"❌ Error in tracking probe: {e}")
         
-        return Gst.PadProbeReturn.OK
+        return _PROBE_OK
 
     def create_pipeline(self):
         """Create DeepStream pipeline with tracking-based counting"""
         if not PYDS_AVAILABLE:
             print("❌ Cannot create DeepStream pipeline - Python bindings not available")
             return False
-        
+
         try:
             # Initialize GStreamer
-            GObject.threads_init()
             Gst.init(None)
-            
+
             # Create pipeline using deepstream-app with configuration
             print(f"📋 Creating pipeline with config: {self.config_path}")
             print("🎯 Using tracking-based object counting")
-            
-            # For this implementation, we'll use the standard deepstream-app
-            # but add our custom probe for tracking-based counting
-            
-            # Run deepstream-app as external process and monitor
+
+            # Start MQTT publisher
+            if self.mqtt_publisher.connect():
+                print("✅ Connected to MQTT broker for tracking-based publishing")
+                self.mqtt_publisher.start_continuous_publishing()
+            else:
+                print("⚠️  Could not connect to MQTT broker")
+
+            # Build the pipeline in-process so the tracking probe actually
+            # runs against the buffers
+            if self.build_pipeline():
+                return self.run_pipeline()
+
+            # Fall back to driving the stock deepstream-app externally
+            print("⚠️  In-process pipeline unavailable - falling back to external deepstream-app")
             return self.run_with_external_deepstream()
-            
+
         except Exception as e:
             print(f"❌ Error creating pipeline: {e}")
             return False
 
+    def _parse_app_config(self):
+        """Read the deepstream-app config sections reproduced in-process"""
+        import configparser
+        config = configparser.ConfigParser(interpolation=None, strict=False)
+        config.read(self.config_path)
+
+        sources = []
+        for section in sorted(config.sections()):
+            if section.startswith('source') and config[section].get('enable', '1') == '1':
+                uri = config[section].get('uri')
+                if uri:
+                    sources.append(uri)
+
+        def section(name):
+            return config[name] if name in config else {}
+
+        return sources, section('streammux'), section('primary-gie'), \
+            section('tracker'), section('tiled-display')
+
+    def _cb_newpad(self, decodebin, decoder_src_pad, source_id):
+        """Link a decoded video pad to its streammux sink pad"""
+        caps = decoder_src_pad.get_current_caps() or decoder_src_pad.query_caps()
+        gstname = caps.get_structure(0).get_name()
+        if 'video' not in gstname:
+            return
+        sinkpad = self.streammux.get_request_pad(f"sink_{source_id}")
+        if sinkpad and not decoder_src_pad.is_linked():
+            if decoder_src_pad.link(sinkpad) != Gst.PadLinkReturn.OK:
+                print(f"❌ Failed to link source {source_id} to streammux")
+
+    def build_pipeline(self):
+        """Build the DeepStream pipeline in-process and attach the probe"""
+        try:
+            sources, mux_cfg, gie_cfg, tracker_cfg, tiler_cfg = self._parse_app_config()
+            if not sources:
+                print("❌ No enabled sources found in config")
+                return False
+
+            self.pipeline = Gst.Pipeline()
+            if not self.pipeline:
+                return False
+
+            # Stream muxer
+            self.streammux = Gst.ElementFactory.make("nvstreammux", "stream-muxer")
+            self.streammux.set_property('width', int(mux_cfg.get('width', 1920)))
+            self.streammux.set_property('height', int(mux_cfg.get('height', 1080)))
+            self.streammux.set_property('batch-size', int(mux_cfg.get('batch-size', len(sources))))
+            self.streammux.set_property('batched-push-timeout', int(mux_cfg.get('batched-push-timeout', 40000)))
+            self.streammux.set_property('live-source', int(mux_cfg.get('live-source', 1)))
+            self.pipeline.add(self.streammux)
+
+            # Decoding source bins
+            for i, uri in enumerate(sources):
+                source_bin = Gst.ElementFactory.make("uridecodebin", f"source-bin-{i}")
+                source_bin.set_property('uri', uri)
+                source_bin.connect('pad-added', self._cb_newpad, i)
+                self.pipeline.add(source_bin)
+
+            # Inference
+            pgie = Gst.ElementFactory.make("nvinfer", "primary-inference")
+            pgie.set_property('config-file-path', gie_cfg.get(
+                'config-file',
+                '/home/deepstream/DeepStream-Yolo/configs/components/config_infer_primary_yolo11.txt'))
+
+            # Tracker
+            tracker = Gst.ElementFactory.make("nvtracker", "tracker")
+            tracker.set_property('tracker-width', int(tracker_cfg.get('tracker-width', 640)))
+            tracker.set_property('tracker-height', int(tracker_cfg.get('tracker-height', 384)))
+            tracker.set_property('ll-lib-file', tracker_cfg.get(
+                'll-lib-file',
+                '/opt/nvidia/deepstream/deepstream/lib/libnvds_nvmultiobjecttracker.so'))
+            ll_config = tracker_cfg.get('ll-config-file')
+            if ll_config:
+                tracker.set_property('ll-config-file', ll_config)
+
+            # Tiler, converter, OSD and display sink
+            tiler = Gst.ElementFactory.make("nvmultistreamtiler", "tiler")
+            tiler.set_property('rows', int(tiler_cfg.get('rows', 1)))
+            tiler.set_property('columns', int(tiler_cfg.get('columns', len(sources))))
+            tiler.set_property('width', int(tiler_cfg.get('width', 1280)))
+            tiler.set_property('height', int(tiler_cfg.get('height', 720)))
+
+            conv = Gst.ElementFactory.make("nvvideoconvert", "converter")
+            osd = Gst.ElementFactory.make("nvdsosd", "onscreendisplay")
+            sink = Gst.ElementFactory.make("nveglglessink", "display-sink")
+            sink.set_property('sync', 0)
+
+            for element in (pgie, tracker, tiler, conv, osd, sink):
+                if not element:
+                    print("❌ Failed to create a pipeline element")
+                    return False
+                self.pipeline.add(element)
+
+            self.streammux.link(pgie)
+            pgie.link(tracker)
+            tracker.link(tiler)
+            tiler.link(conv)
+            conv.link(osd)
+            osd.link(sink)
+
+            # Attach the tracking probe where the overlays are drawn
+            osd_sink_pad = osd.get_static_pad('sink')
+            if osd_sink_pad:
+                osd_sink_pad.add_probe(Gst.PadProbeType.BUFFER,
+                                       self.osd_sink_pad_buffer_probe, 0)
+
+            print(f"✅ In-process pipeline built: {len(sources)} sources, tracking probe attached")
+            return True
+
+        except Exception as e:
+            print(f"❌ Error building in-process pipeline: {e}")
+            self.pipeline = None
+            return False
+
+    def run_pipeline(self):
+        """Run the in-process pipeline until EOS or error"""
+        self.loop = GLib.MainLoop()
+        bus = self.pipeline.get_bus()
+        bus.add_signal_watch()
+        bus.connect('message', self.bus_call, self.loop)
+
+        print("🚀 Starting in-process DeepStream pipeline")
+        self.pipeline.set_state(Gst.State.PLAYING)
+        try:
+            self.loop.run()
+        except Exception as e:
+            print(f"❌ Pipeline error: {e}")
+        finally:
+            self.pipeline.set_state(Gst.State.NULL)
+        return True
+
     def run_with_external_deepstream(self):
         """Run DeepStream app externally and handle MQTT publishing"""
         try:
-            # Start MQTT publisher
-            if self.mqtt_publisher.connect():
-                print("✅ Connected to MQTT broker for tracking-based publishing")
-                self.mqtt_publisher.start_continuous_publishing()
-            else:
-                print("⚠️  Could not connect to MQTT broker")
-            
             # Change to DeepStream directory
             deepstream_dir = '/opt/nvidia/deepstream/deepstream-7.1'
             original_dir = os.getcwd()
@@ -251,10 +437,12 @@ def monitor_and_publish():
                 # Start continuous publishing
                 mqtt_publisher.start_continuous_publishing()
                 
-                # Keep monitoring
-                while running and mqtt_publisher.client.is_connected():
-                    time.sleep(1)
-                    
+                # Block until on_disconnect fires instead of polling
+                # is_connected() once a second - the thread is a daemon, so
+                # sleeping here does not hold up shutdown
+                mqtt_publisher.disconnected.wait()
+                mqtt_publisher.disconnected.clear()
+
                 if not running:
                     break
                     
@@ -271,7 +459,8 @@ def monitor_and_publish():
                     time.sleep(30)
                     reconnect_attempts = 0  # Reset for next attempt
                 else:
-                    time.sleep(5)  # Wait before retry
+                    # Exponential backoff before retrying: 1, 2, 4, 8, 16 s
+                    time.sleep(min(2 ** (reconnect_attempts - 1), 30))
                     
         except Exception as e:
             print(f"❌ MQTT monitoring error: {e}")
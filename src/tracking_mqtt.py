@@ -6,20 +6,66 @@ Publishes unique object counts based on NVIDIA Analytics tracker IDs instead of
 """
 
 import json
+import select
+import socket
 import time
 import threading
 from datetime import datetime
 import paho.mqtt.client as mqtt
+from paho.mqtt.packettypes import PacketTypes
+from paho.mqtt.properties import Properties
 import psutil
 import os
 import subprocess
-from collections import defaultdict
 
 # Import from same directory
 import sys
 sys.path.append(os.path.dirname(__file__))
 from tracking_based_counter import TrackingBasedCounter
 
+# Fast JSON serialization for the per-tick payloads - orjson emits bytes in
+# a single C pass; compact stdlib encoding is the fallback
+try:
+    import orjson
+
+    def _json_payload(data):
+        return orjson.dumps(data)
+except ImportError:
+    def _json_payload(data):
+        return json.dumps(data, separators=(',', ':')).encode()
+
+# Binary payload packing - msgpack emits ~30-50% smaller messages than
+# JSON for this mostly-numeric schema and its Packer reuses one internal
+# buffer across calls, so steady-state publishing stops allocating fresh
+# strings. JSON remains the format when msgpack is not installed
+try:
+    import msgpack
+    MSGPACK_AVAILABLE = True
+except ImportError:
+    msgpack = None
+    MSGPACK_AVAILABLE = False
+
+# Optional asyncio transport - one event loop owning both the timers and
+# the socket removes the thread/GIL handoffs of the blocking path; the
+# threaded paho client stays as the fallback (and for the DeepStream app)
+try:
+    import asyncio
+    import aiomqtt
+    AIOMQTT_AVAILABLE = True
+except ImportError:
+    aiomqtt = None
+    AIOMQTT_AVAILABLE = False
+
+# In-process GPU telemetry - NVML answers utilization/memory queries in
+# microseconds without forking nvidia-smi; the subprocess path stays as
+# the fallback when pynvml is not installed
+try:
+    import pynvml
+    PYNVML_AVAILABLE = True
+except ImportError:
+    pynvml = None
+    PYNVML_AVAILABLE = False
+
 class TrackingMQTTPublisher:
     def __init__(self, config_file=None):
         # Load configuration from file
@@ -40,18 +86,114 @@ class TrackingMQTTPublisher:
         self.connected = False
         self.counter = TrackingBasedCounter()
         self.publishing = False
-        
-        # Tracking-based counting data
-        self.tracked_objects = defaultdict(set)  # {stream_id: {object_ids}}
-        self.session_counts = defaultdict(int)   # {stream_id: session_count}
-        self.tracking_enabled = True
-        
+        # Set by on_disconnect so monitors can wait() instead of polling
+        # is_connected() once a second
+        self.disconnected = threading.Event()
+        # Set as soon as any CONNACK is processed, so connect() returns the
+        # moment the broker answers instead of rounding up to a poll slice
+        self._connack_evt = threading.Event()
+
+        # MQTT5 topic aliases - after the first publish on a topic only a
+        # small integer travels instead of the full topic string. The
+        # broker advertises how many aliases it accepts in its CONNACK
+        self._topic_aliases = {topic: i + 1 for i, topic in enumerate(self.topics.values())}
+        self._alias_props = {}
+        self._alias_established = set()
+        self._alias_max = 0
+
+
+        # Payload serializer - msgpack's Packer keeps one reusable buffer;
+        # subscribers sniff the format (JSON parses as text, msgpack does
+        # not), so either encoding interoperates
+        if MSGPACK_AVAILABLE:
+            self._packer = msgpack.Packer(use_bin_type=True)
+            self._serialize = self._packer.pack
+        else:
+            self._packer = None
+            self._serialize = _json_payload
+        # Prime psutil's CPU accounting so later interval=None reads return
+        # usage since the previous call without sleeping, and cache the boot
+        # time - it never changes
+        try:
+            psutil.cpu_percent(interval=None)
+            self._boot_time = psutil.boot_time()
+        except Exception:
+            self._boot_time = time.time()
+
+        # NVML handle for zero-fork GPU health queries, when available
+        self._gpu_handle = None
+        if PYNVML_AVAILABLE:
+            try:
+                pynvml.nvmlInit()
+                self._gpu_handle = pynvml.nvmlDeviceGetHandleByIndex(0)
+            except Exception as e:
+                print(f"⚠️  NVML not available, falling back to nvidia-smi: {e}")
+
+        # Per-tick cache for the counter's aggregate counts - the publish
+        # cycle reads the same data for every stream plus analytics/health
+        self._counts_cache = None
+        self._counts_cache_ts = 0.0
+
         # Camera location mapping
         self.camera_locations = {
             0: {"name": "Camera 1 (102)", "ip": "10.20.100.102", "area": "Production Area 1", "stream": "subtype=0"},
             1: {"name": "Camera 2 (103)", "ip": "10.20.100.103", "area": "Production Area 2", "stream": "subtype=0"}
         }
+        n_streams = len(self.camera_locations)
+
+        # Per-stream locks guarding the tracked-object snapshots shared
+        # between the probe thread and the publish loop - one lock per
+        # stream so the cameras never contend with each other
+        self._stream_locks = [threading.Lock() for _ in range(n_streams)]
+
+        # Tracking-based counting data - plain fixed-size lists indexed by
+        # stream ID: only two streams exist, and list indexing skips the
+        # per-access hashing a dict costs on the hot paths
+        self.tracked_objects = [frozenset() for _ in range(n_streams)]
+        self.session_counts = [0] * n_streams
+        self.tracking_enabled = True
+
+        # Delta publishing state: last published ID set per stream, plus
+        # the deadline for the next retained full snapshot
+        self._last_published = [frozenset()] * n_streams
+        self._snapshot_due = [0.0] * n_streams
+
+        # Per-stream (topic, camera_info) pairs resolved once - the publish
+        # path fetches both with a single index instead of formatting a
+        # "sourceN" key and probing two dicts per call
+        self._stream_meta = tuple(
+            (self.topics.get(f"source{sid}"), self.camera_locations[sid])
+            for sid in range(n_streams)
+        )
         
+        # Static payload skeletons - the per-tick publishes only mutate the
+        # changing fields instead of rebuilding every dict from scratch
+        self._payload_tpl = [
+            {
+                "timestamp": "",
+                "source_id": sid,
+                "unique_objects_tracked": 0,
+                "session_new_objects": 0,
+                "total_objects_detected": 0,
+                "can_count": 0,
+                "added_ids": [],
+                "removed_ids": [],
+                "message_type": "tracking_count_update"
+            }
+            for sid in range(n_streams)
+        ]
+        self._analytics_tpl = {
+            "timestamp": "",
+            "counting_method": "nvidia_analytics_tracker_ids",
+            "total_unique_objects_tracked": 0,
+            "total_session_new_objects": 0,
+            "total_persistent_count": 0,
+            "active_streams": 0,
+            "per_stream_breakdown": {},
+            "analytics_enabled": self.tracking_enabled,
+            "message_type": "analytics_summary"
+        }
+
         print(f"🎯 Tracking-Based MQTT Publisher initialized")
         print(f"📡 Broker: {self.broker_host}:{self.broker_port}")
         print(f"🔐 Client ID: {self.client_id}")
@@ -97,14 +239,33 @@ class TrackingMQTTPublisher:
         if reason_code.is_failure:
             print(f"❌ Failed to connect to MQTT broker: {reason_code}")
             self.connected = False
+            self._connack_evt.set()
         else:
             self.connected = True
+            self.disconnected.clear()
+            self._connack_evt.set()
+
+            # Topic aliases are per-connection state; honour the broker's
+            # advertised limit and renegotiate after every reconnect
+            self._alias_established.clear()
+            self._alias_max = getattr(properties, 'TopicAliasMaximum', 0) or 0
+
+            # Retained birth messages carry the static camera metadata so
+            # the per-tick payloads only ship the dynamic fields
+            for sid, info in self.camera_locations.items():
+                meta = dict(info)
+                meta["source_id"] = sid
+                meta["counting_method"] = "tracker_ids"
+                meta["message_type"] = "camera_meta"
+                client.publish(f"camera{sid + 1}/meta", self._serialize(meta), qos=0, retain=True)
+
             print(f"✅ Connected to tracking-based MQTT broker")
             print(f"📡 {self.broker_host}:{self.broker_port}")
     
     def on_disconnect(self, client, userdata, flags, reason_code, properties):
         """Callback for MQTT disconnection (VERSION2)"""
         self.connected = False
+        self.disconnected.set()
         print(f"📡 Disconnected from MQTT broker")
     
     def on_publish(self, client, userdata, mid, reason_code, properties):
@@ -114,7 +275,8 @@ class TrackingMQTTPublisher:
     def connect(self):
         """Connect to the production MQTT broker"""
         try:
-            self.client = mqtt.Client(client_id=self.client_id, callback_api_version=mqtt.CallbackAPIVersion.VERSION2)
+            self.client = mqtt.Client(client_id=self.client_id, protocol=mqtt.MQTTv5,
+                                      callback_api_version=mqtt.CallbackAPIVersion.VERSION2)
             
             # Set credentials
             print(f"🔐 Setting MQTT credentials for user: {self.username}")
@@ -125,16 +287,39 @@ class TrackingMQTTPublisher:
             self.client.on_disconnect = self.on_disconnect
             self.client.on_publish = self.on_publish
             
+            # Queue tuning - deeper client-side queues absorb broker
+            # hiccups without dropping QoS0 ticks. Reconnect backoff lives
+            # in the app-level reconnect loops: paho's reconnect_delay_set
+            # only applies to loop_start/loop_forever, and this publisher
+            # drives the socket manually
+            self.client.max_queued_messages_set(1000)
+            self.client.max_inflight_messages_set(100)
+
             # Connect to broker
             print(f"🔌 Connecting to MQTT broker: {self.broker_host}:{self.broker_port}")
             self.client.connect(self.broker_host, self.broker_port, 60)
-            self.client.loop_start()
-            
-            # Wait for connection
-            timeout = 10
-            while not self.connected and timeout > 0:
-                time.sleep(0.5)
-                timeout -= 0.5
+
+            # Socket tuning: disable Nagle so the small per-tick publishes
+            # leave immediately instead of waiting ~40 ms to coalesce, and
+            # size the send buffer to hold a whole tick's burst in one flush
+            try:
+                sock = self.client.socket()
+                if sock is not None:
+                    sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+                    sock.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, 256 * 1024)
+            except Exception as e:
+                print(f"⚠️  Could not tune MQTT socket: {e}")
+
+            # Manual network loop - the publisher never subscribes, so
+            # rather than paho's background thread competing for the GIL,
+            # the publish loop drives the socket itself. Drive it here until
+            # on_connect signals the CONNACK - the Event ends the wait the
+            # instant the broker answers, success or refusal, instead of
+            # rounding up to a poll interval
+            self._connack_evt.clear()
+            deadline = time.monotonic() + 10
+            while not self._connack_evt.is_set() and time.monotonic() < deadline:
+                self.client.loop(timeout=0.5)
             
             if self.connected:
                 print(f"✅ Successfully connected to MQTT broker")
@@ -152,151 +337,270 @@ class TrackingMQTTPublisher:
         try:
             self.publishing = False
             if self.client:
-                self.client.loop_stop()
                 self.client.disconnect()
+                # Flush the DISCONNECT frame - there is no network thread
+                self.client.loop_write()
             print("📡 MQTT disconnected")
         except Exception as e:
             print(f"❌ MQTT disconnect error: {e}")
     
+    def _apply_tracked_update(self, stream_id, tracked_object_ids):
+        """Apply one stream's tracked-ID snapshot; caller holds the lock
+
+        New objects are found by set difference against the previous
+        snapshot - the old count-delta heuristic missed arrivals whenever
+        departures happened in the same frame. The stored snapshot is a
+        frozenset so readers can take it by reference without copying.
+        """
+        incoming = frozenset(tracked_object_ids)
+        new_ids = incoming - self.tracked_objects[stream_id]
+        self.tracked_objects[stream_id] = incoming
+
+        if new_ids:
+            self.session_counts[stream_id] += len(new_ids)
+            print(f"🎯 Stream {stream_id}: {len(new_ids)} new tracked objects (Total: {len(incoming)})")
+
     def update_tracked_objects(self, stream_id, tracked_object_ids):
         """Update tracked objects for a stream (called from DeepStream probe)"""
-        with threading.Lock():
-            previous_count = len(self.tracked_objects[stream_id])
-            self.tracked_objects[stream_id] = set(tracked_object_ids)
-            current_count = len(self.tracked_objects[stream_id])
-            
-            # If we have new objects, update session count
-            if current_count > previous_count:
-                new_objects = current_count - previous_count
-                self.session_counts[stream_id] += new_objects
-                print(f"🎯 Stream {stream_id}: {new_objects} new tracked objects (Total: {current_count})")
+        if stream_id >= len(self._stream_locks):
+            return
+        with self._stream_locks[stream_id]:
+            self._apply_tracked_update(stream_id, tracked_object_ids)
+
+    def update_batch(self, batch_updates):
+        """Apply a whole batch's updates ({stream_id: ids}) in one call
+
+        The probe hands over every stream in a buffer at once; each
+        stream's snapshot is swapped under its own lock so updates never
+        contend across cameras.
+        """
+        for stream_id, tracked_object_ids in batch_updates.items():
+            if stream_id >= len(self._stream_locks):
+                continue
+            with self._stream_locks[stream_id]:
+                self._apply_tracked_update(stream_id, tracked_object_ids)
     
-    def publish_tracking_count(self, stream_id):
+    def _publish(self, topic, payload, qos=0, retain=False):
+        """Publish with an MQTT5 topic alias when the broker allows one
+
+        The first publish on a topic carries both the name and the alias;
+        every later one sends an empty topic plus the integer alias.
+        """
+        alias = self._topic_aliases.get(topic)
+        if alias is None or alias > self._alias_max:
+            return self.client.publish(topic, payload, qos=qos, retain=retain)
+
+        props = self._alias_props.get(topic)
+        if props is None:
+            props = Properties(PacketTypes.PUBLISH)
+            props.TopicAlias = alias
+            self._alias_props[topic] = props
+
+        if topic in self._alias_established:
+            return self.client.publish("", payload, qos=qos, retain=retain, properties=props)
+        self._alias_established.add(topic)
+        return self.client.publish(topic, payload, qos=qos, retain=retain, properties=props)
+
+    def _counts(self):
+        """Aggregate counter counts, cached for one publish cycle
+
+        A 0.9 s TTL keeps every 1 Hz tick fresh while collapsing the
+        multiple per-tick readers (two streams, analytics, health) onto a
+        single get_all_counts() call.
+        """
+        now = time.monotonic()
+        if self._counts_cache is None or now - self._counts_cache_ts > 0.9:
+            self._counts_cache = self.counter.get_all_counts()
+            self._counts_cache_ts = now
+        return self._counts_cache
+
+    def _build_tracking_messages(self, stream_id, now_iso):
+        """Build one camera's delta payload (plus the retained snapshot
+        when due) as (topic, payload, retain) tuples, without publishing"""
+        if stream_id >= len(self._stream_meta):
+            return ()
+        topic, _camera_info = self._stream_meta[stream_id]
+
+        if not topic:
+            return ()
+
+        # The stored snapshot is an immutable frozenset, so grabbing the
+        # reference is a consistent lock-free snapshot of one update
+        cur = self.tracked_objects[stream_id]
+        if not isinstance(cur, frozenset):
+            cur = frozenset(cur)
+        unique_objects = len(cur)
+
+        # Get persistent count data - the counter is the single source of
+        # truth for session counts; self.session_counts only drives the
+        # per-update console prints
+        counts = self._counts()
+        session_count = counts['session_counts'].get(stream_id, 0)
+        total_count = counts['stream_totals'].get(stream_id, 0)
+
+        # Ship only the IDs that changed since the last publish - the
+        # full array dominated bytes-on-wire once the set grew, and it
+        # was resent every second even when nothing changed
+        last = self._last_published[stream_id]
+        self._last_published[stream_id] = cur
+
+        # Mutate only the changing fields of the prebuilt skeleton
+        tpl = self._payload_tpl[stream_id]
+        tpl["timestamp"] = now_iso
+        tpl["unique_objects_tracked"] = unique_objects
+        tpl["session_new_objects"] = session_count
+        tpl["total_objects_detected"] = total_count
+        tpl["can_count"] = total_count  # Assuming all detected objects are cans
+        tpl["added_ids"] = list(cur - last)
+        tpl["removed_ids"] = list(last - cur)
+
+        messages = [(topic, self._serialize(tpl), False)]
+
+        # Retained full snapshot once a minute so late subscribers can
+        # recover the current set without replaying deltas
+        now_mono = time.monotonic()
+        if now_mono >= self._snapshot_due[stream_id]:
+            self._snapshot_due[stream_id] = now_mono + 60.0
+            snapshot = {
+                "timestamp": now_iso,
+                "source_id": stream_id,
+                "tracked_object_ids": sorted(cur),
+                "message_type": "tracking_snapshot"
+            }
+            messages.append((f"camera{stream_id + 1}/snapshot",
+                             self._serialize(snapshot), True))
+
+        return messages
+
+    def publish_tracking_count(self, stream_id, now_iso=None):
         """Publish tracking-based count for specific source/camera"""
         try:
             if not self.connected:
                 return False
-            
-            camera_info = self.camera_locations.get(stream_id, {})
-            topic = self.topics.get(f"source{stream_id}")
-            
-            if not topic:
-                return False
-            
-            # Get current tracking data
-            unique_objects = len(self.tracked_objects[stream_id])
-            session_count = self.session_counts[stream_id]
-            
-            # Get persistent count data
-            counts = self.counter.get_all_counts()
-            session_count = counts['session_counts'].get(stream_id, 0)
-            total_count = counts['stream_totals'].get(stream_id, 0)
-            
-            payload = {
-                "timestamp": datetime.now().isoformat(),
-                "source_id": stream_id,
-                "camera_name": camera_info.get("name", f"Camera {stream_id + 1}"),
-                "camera_ip": camera_info.get("ip", "unknown"),
-                "location": camera_info.get("area", "unknown"),
-                "counting_method": "tracker_ids",
-                "unique_objects_tracked": unique_objects,
-                "session_new_objects": session_count,
-                "total_objects_detected": total_count,
-                "can_count": total_count,  # Assuming all detected objects are cans
-                "tracked_object_ids": list(self.tracked_objects[stream_id]),
-                "message_type": "tracking_count_update"
-            }
-            
-            result = self.client.publish(topic, json.dumps(payload), qos=0)
-            return result.rc == mqtt.MQTT_ERR_SUCCESS
-            
+
+            if now_iso is None:
+                now_iso = datetime.now().isoformat()
+
+            ok = True
+            for topic, payload, retain in self._build_tracking_messages(stream_id, now_iso):
+                result = self._publish(topic, payload, qos=0, retain=retain)
+                ok = ok and result.rc == mqtt.MQTT_ERR_SUCCESS
+            return ok
+
         except Exception as e:
             print(f"❌ Error publishing tracking count: {e}")
             return False
-    
-    def publish_analytics_summary(self):
+
+    def _build_analytics_message(self, now_iso):
+        """Build the analytics summary as a (topic, payload) pair"""
+        topic = self.topics["analytics"]
+
+        total_unique_objects = sum(len(objects) for objects in self.tracked_objects)
+        total_session_objects = sum(self.session_counts)
+
+        # Get persistent counts
+        counts = self._counts()
+        total_persistent = sum(counts['stream_totals'].values())
+
+        tpl = self._analytics_tpl
+        tpl["timestamp"] = now_iso
+        tpl["total_unique_objects_tracked"] = total_unique_objects
+        tpl["total_session_new_objects"] = total_session_objects
+        tpl["total_persistent_count"] = total_persistent
+        tpl["active_streams"] = len(self.tracked_objects)
+        tpl["per_stream_breakdown"] = {
+            str(stream_id): {
+                "unique_objects": len(objects),
+                "session_count": self.session_counts[stream_id]
+            }
+            for stream_id, objects in enumerate(self.tracked_objects)
+        }
+
+        return topic, self._serialize(tpl)
+
+    def publish_analytics_summary(self, now_iso=None):
         """Publish analytics summary across all streams"""
         try:
             if not self.connected:
                 return False
-            
-            topic = self.topics["analytics"]
-            
-            total_unique_objects = sum(len(objects) for objects in self.tracked_objects.values())
-            total_session_objects = sum(self.session_counts.values())
-            
-            # Get persistent counts
-            counts = self.counter.get_all_counts()
-            total_persistent = sum(counts['stream_totals'].values())
-            
-            payload = {
-                "timestamp": datetime.now().isoformat(),
-                "counting_method": "nvidia_analytics_tracker_ids",
-                "total_unique_objects_tracked": total_unique_objects,
-                "total_session_new_objects": total_session_objects,
-                "total_persistent_count": total_persistent,
-                "active_streams": len(self.tracked_objects),
-                "per_stream_breakdown": {
-                    str(stream_id): {
-                        "unique_objects": len(objects),
-                        "session_count": self.session_counts[stream_id]
-                    }
-                    for stream_id, objects in self.tracked_objects.items()
-                },
-                "analytics_enabled": self.tracking_enabled,
-                "message_type": "analytics_summary"
-            }
-            
-            result = self.client.publish(topic, json.dumps(payload), qos=0)
+
+            if now_iso is None:
+                now_iso = datetime.now().isoformat()
+
+            topic, payload = self._build_analytics_message(now_iso)
+            result = self._publish(topic, payload, qos=0)
             return result.rc == mqtt.MQTT_ERR_SUCCESS
-            
+
         except Exception as e:
             print(f"❌ Error publishing analytics summary: {e}")
             return False
     
-    def get_system_health(self):
+    def get_system_health(self, now_iso=None):
         """Get comprehensive system health information including tracking status"""
         try:
-            # CPU and Memory
-            cpu_percent = psutil.cpu_percent(interval=1)
+            if now_iso is None:
+                now_iso = datetime.now().isoformat()
+
+            # CPU and Memory - interval=None returns usage since the last
+            # call (primed at init) instead of sleeping a second in the
+            # publishing thread
+            cpu_percent = psutil.cpu_percent(interval=None)
             memory = psutil.virtual_memory()
             disk = psutil.disk_usage('/')
             
-            # GPU information (if available)
+            # GPU information (if available) - NVML is an in-process call,
+            # nvidia-smi is the forking fallback
             gpu_info = {"utilization": "[N/A]%", "memory_used": "[N/A]MB", "memory_total": "[N/A]MB"}
-            try:
-                gpu_result = subprocess.run(['nvidia-smi', '--query-gpu=utilization.gpu,memory.used,memory.total', '--format=csv,noheader,nounits'], 
-                                          capture_output=True, text=True, timeout=5)
-                if gpu_result.returncode == 0:
-                    gpu_data = gpu_result.stdout.strip().split(', ')
-                    if len(gpu_data) >= 3:
-                        gpu_info = {
-                            "utilization": f"{gpu_data[0]}%",
-                            "memory_used": f"{gpu_data[1]}MB",
-                            "memory_total": f"{gpu_data[2]}MB"
-                        }
-            except:
-                pass
-            
-            # Check if DeepStream process is running
+            if self._gpu_handle is not None:
+                try:
+                    util = pynvml.nvmlDeviceGetUtilizationRates(self._gpu_handle)
+                    mem = pynvml.nvmlDeviceGetMemoryInfo(self._gpu_handle)
+                    gpu_info = {
+                        "utilization": f"{util.gpu}%",
+                        "memory_used": f"{mem.used // (1024 * 1024)}MB",
+                        "memory_total": f"{mem.total // (1024 * 1024)}MB"
+                    }
+                except:
+                    pass
+            else:
+                try:
+                    gpu_result = subprocess.run(['nvidia-smi', '--query-gpu=utilization.gpu,memory.used,memory.total', '--format=csv,noheader,nounits'],
+                                              capture_output=True, text=True, timeout=5)
+                    if gpu_result.returncode == 0:
+                        gpu_data = gpu_result.stdout.strip().split(', ')
+                        if len(gpu_data) >= 3:
+                            gpu_info = {
+                                "utilization": f"{gpu_data[0]}%",
+                                "memory_used": f"{gpu_data[1]}MB",
+                                "memory_total": f"{gpu_data[2]}MB"
+                            }
+                except:
+                    pass
+
+            # Check if DeepStream process is running - in-process scan
+            # instead of forking pgrep
             deepstream_running = False
             try:
-                result = subprocess.run(['pgrep', '-f', 'deepstream'], capture_output=True)
-                deepstream_running = result.returncode == 0
+                for proc in psutil.process_iter(['name', 'cmdline']):
+                    info = proc.info
+                    if 'deepstream' in (info['name'] or '') or \
+                            any('deepstream' in part for part in (info['cmdline'] or ())):
+                        deepstream_running = True
+                        break
             except:
                 pass
             
             # Get tracking-based counts
-            total_unique_objects = sum(len(objects) for objects in self.tracked_objects.values())
-            total_session_objects = sum(self.session_counts.values())
+            total_unique_objects = sum(len(objects) for objects in self.tracked_objects)
+            total_session_objects = sum(self.session_counts)
             
             # Get persistent counts
-            counts = self.counter.get_all_counts()
+            counts = self._counts()
             total_persistent = sum(counts['stream_totals'].values())
             total_cans = total_persistent  # Assuming all detected objects are cans
             
             health_data = {
-                "timestamp": datetime.now().isoformat(),
+                "timestamp": now_iso,
                 "system_status": "healthy" if cpu_percent < 80 and memory.percent < 85 else "warning",
                 "deepstream_running": deepstream_running,
                 "cpu_usage": f"{cpu_percent:.1f}%",
@@ -311,7 +615,7 @@ class TrackingMQTTPublisher:
                 "tracking_enabled": self.tracking_enabled,
                 "active_cameras": len(self.camera_locations),
                 "active_streams": len(self.tracked_objects),
-                "uptime_hours": (time.time() - psutil.boot_time()) / 3600,
+                "uptime_hours": (time.time() - self._boot_time) / 3600,
                 "message_type": "health_status"
             }
             
@@ -321,27 +625,67 @@ class TrackingMQTTPublisher:
             print(f"❌ Error getting system health: {e}")
             return None
     
-    def publish_health_status(self):
+    def publish_health_status(self, now_iso=None):
         """Publish system health status"""
         try:
             if not self.connected:
                 return False
             
-            health_data = self.get_system_health()
+            health_data = self.get_system_health(now_iso)
             if not health_data:
                 return False
             
             topic = self.topics["health"]
-            result = self.client.publish(topic, json.dumps(health_data), qos=0)
+            result = self._publish(topic, self._serialize(health_data), qos=0)
             return result.rc == mqtt.MQTT_ERR_SUCCESS
             
         except Exception as e:
             print(f"❌ Error publishing health status: {e}")
             return False
     
+    def _flush_publishes(self):
+        """Drive paho's manual network loop for one tick
+
+        Flushes all queued PUBLISH frames in a single write, runs keepalive
+        housekeeping, and reads only when the socket actually has data
+        (broker ACKs/pings) - there is no background network thread.
+        """
+        try:
+            self.client.loop_write()
+            self.client.loop_misc()
+            sock = self.client.socket()
+            if sock is not None and select.select([sock], [], [], 0)[0]:
+                self.client.loop_read()
+        except Exception:
+            # A failed flush only delays the queued messages until the
+            # next tick; it never loses them
+            pass
+
     def start_continuous_publishing(self):
         """Start continuous publishing with tracking-based counts"""
         def publish_loop():
+            # Keep the 1 s deadlines from blowing up under DeepStream load:
+            # pin this thread to one core (last core by default, override or
+            # disable via MQTT_CPU_AFFINITY="2,3" / "") and raise its
+            # priority. Both are best-effort - affinity needs Linux,
+            # renicing needs CAP_SYS_NICE
+            try:
+                aff_env = os.getenv('MQTT_CPU_AFFINITY')
+                if aff_env is None:
+                    cpus = {os.cpu_count() - 1}
+                elif aff_env.strip():
+                    cpus = {int(c) for c in aff_env.split(',')}
+                else:
+                    cpus = None
+                if cpus:
+                    os.sched_setaffinity(0, cpus)
+            except Exception as e:
+                print(f"⚠️  Could not set publisher CPU affinity: {e}")
+            try:
+                os.nice(int(os.getenv('MQTT_NICE', '-5')))
+            except Exception:
+                pass
+
             print("🚀 Starting tracking-based MQTT publishing (1-second intervals)")
             print("📊 Topics:")
             for source, topic in self.topics.items():
@@ -350,24 +694,56 @@ class TrackingMQTTPublisher:
             print()
             
             self.publishing = True
-            
+
+            # Absolute monotonic deadlines per task - the old wall-clock
+            # int(time.time()) % N test could fire twice in one second or
+            # skip a cycle entirely once the loop drifted off whole seconds
+            now = time.monotonic()
+            next_track = next_analytics = next_health = now
+
             while self.publishing:
                 try:
-                    if self.connected:
-                        # Publish tracking-based counts for each stream
+                    if not self.connected:
+                        time.sleep(1.0)
+                        continue
+
+                    # Queue the due messages back-to-back, then flush the
+                    # socket once - per-topic routing stays as-is (the
+                    # subscribers key on camera/health/analytics topics)
+                    # but the TCP writes coalesce into one send
+                    now = time.monotonic()
+                    published = False
+
+                    # One timestamp per tick - every payload going out in
+                    # this flush carries the same instant anyway
+                    now_iso = datetime.now().isoformat()
+
+                    if now >= next_track:
                         for source_id in range(2):  # Only 2 cameras
-                            self.publish_tracking_count(source_id)
-                        
-                        # Publish analytics summary every 5 seconds
-                        if int(time.time()) % 5 == 0:
-                            self.publish_analytics_summary()
-                        
-                        # Publish health status every 10 seconds
-                        if int(time.time()) % 10 == 0:
-                            self.publish_health_status()
-                    
-                    time.sleep(1.0)  # 1-second intervals
-                    
+                            self.publish_tracking_count(source_id, now_iso)
+                        next_track = now + 1.0
+                        published = True
+
+                    # Analytics summary every 5 seconds
+                    if now >= next_analytics:
+                        self.publish_analytics_summary(now_iso)
+                        next_analytics = now + 5.0
+                        published = True
+
+                    # Health status every 10 seconds
+                    if now >= next_health:
+                        self.publish_health_status(now_iso)
+                        next_health = now + 10.0
+                        published = True
+
+                    if published:
+                        self._flush_publishes()
+
+                    # Sleep exactly until the earliest deadline
+                    delay = min(next_track, next_analytics, next_health) - time.monotonic()
+                    if delay > 0:
+                        time.sleep(delay)
+
                 except Exception as e:
                     print(f"❌ Publishing error: {e}")
                     time.sleep(1.0)
@@ -378,6 +754,69 @@ class TrackingMQTTPublisher:
         
         return True
     
+    async def run_async(self):
+        """asyncio publisher: one coroutine owns connection, timers and
+        socket, with exponential reconnect backoff
+
+        Publishes the same messages on the same schedule as the threaded
+        publish loop, built by the shared _build_* helpers.
+        """
+        backoff = 1
+        while True:
+            try:
+                async with aiomqtt.Client(
+                        hostname=self.broker_host, port=self.broker_port,
+                        username=self.username, password=self.password,
+                        identifier=self.client_id) as client:
+                    print("✅ Connected to tracking-based MQTT broker (asyncio)")
+                    backoff = 1
+                    self.connected = True
+                    self.publishing = True
+
+                    now = time.monotonic()
+                    next_track = next_analytics = next_health = now
+                    while self.publishing:
+                        now = time.monotonic()
+                        now_iso = datetime.now().isoformat()
+                        pending = []
+
+                        if now >= next_track:
+                            for sid in range(len(self._payload_tpl)):
+                                for topic, payload, retain in self._build_tracking_messages(sid, now_iso):
+                                    pending.append(client.publish(topic, payload, qos=0, retain=retain))
+                            next_track = now + 1.0
+
+                        if now >= next_analytics:
+                            topic, payload = self._build_analytics_message(now_iso)
+                            pending.append(client.publish(topic, payload, qos=0))
+                            next_analytics = now + 5.0
+
+                        if now >= next_health:
+                            health_data = self.get_system_health(now_iso)
+                            if health_data:
+                                pending.append(client.publish(
+                                    self.topics["health"], self._serialize(health_data), qos=0))
+                            next_health = now + 10.0
+
+                        if pending:
+                            await asyncio.gather(*pending)
+
+                        delay = min(next_track, next_analytics, next_health) - time.monotonic()
+                        if delay > 0:
+                            await asyncio.sleep(delay)
+
+                # The inner loop only exits when stop_publishing() cleared
+                # the flag - a clean shutdown, not a dropped connection, so
+                # leave instead of reconnecting
+                self.connected = False
+                break
+
+            except aiomqtt.MqttError as e:
+                self.connected = False
+                print(f"🔌 MQTT connection lost ({e}), reconnecting in {backoff}s...")
+                await asyncio.sleep(backoff)
+                backoff = min(backoff * 2, 30)
+
     def stop_publishing(self):
         """Stop continuous publishing"""
         self.publishing = False
@@ -385,8 +824,22 @@ class TrackingMQTTPublisher:
 
 def main():
     """Run the tracking-based MQTT publisher"""
+    import random
+
+    # Shorter GIL rotation so the publish thread's socket work gets the
+    # interpreter promptly instead of waiting out the default 5 ms slice
+    sys.setswitchinterval(0.001)
+
     publisher = TrackingMQTTPublisher()
-    reconnect_delay = 5  # seconds
+    # Bounded exponential reconnect backoff, reset on a successful connect
+    reconnect_delay = 1  # seconds, doubling up to 30
+
+    # Synthetic tracking data is for demos only - production runs pay zero
+    # cost for it unless explicitly opted in. The injector owns its own
+    # per-stream ID sets so each tick is a set-membership probe plus an
+    # add, never a copy of the publisher's state
+    demo_mode = bool(os.getenv("DEEPSTREAM_DEMO_MODE"))
+    demo_seen = [set(), set()]
 
     print("🎯 TRACKING-BASED MQTT PUBLISHER")
     print("================================")
@@ -395,6 +848,18 @@ def main():
     print("📡 Publishing unique object counts via MQTT")
     print()
 
+    # Prefer the single-task asyncio transport when aiomqtt is installed -
+    # the threaded paho path below remains the fallback (and carries the
+    # demo injector)
+    if AIOMQTT_AVAILABLE:
+        try:
+            asyncio.run(publisher.run_async())
+        except KeyboardInterrupt:
+            print("\n🛑 Stopping tracking-based MQTT publisher...")
+            publisher.stop_publishing()
+            publisher.counter.cleanup()
+        return
+
     while True:
         try:
             if not publisher.connected:
@@ -402,31 +867,34 @@ def main():
                 if publisher.connect():
                     print("✅ MQTT Publisher connected, starting tracking-based publishing.")
                     publisher.start_continuous_publishing()
+                    reconnect_delay = 1
                 else:
                     print(f"❌ Connection failed. Retrying in {reconnect_delay} seconds...")
                     time.sleep(reconnect_delay)
+                    reconnect_delay = min(reconnect_delay * 2, 30)
                     continue
 
             # If connected, just keep the script alive and check connection
             while publisher.connected:
                 time.sleep(1)
-                
-                # Simulate some tracking data for demonstration
-                # In real implementation, this would be called from DeepStream probe
-                import random
-                if random.random() < 0.1:  # 10% chance to add new object
-                    stream_id = random.randint(0, 1)
-                    new_object_id = random.randint(1000, 9999)
-                    current_objects = list(publisher.tracked_objects[stream_id])
-                    if new_object_id not in current_objects:
-                        current_objects.append(new_object_id)
-                        publisher.update_tracked_objects(stream_id, current_objects)
+
+                # In the real deployment the DeepStream probe feeds the
+                # publisher; the demo injector mutates its own set and hands
+                # it over directly - update_tracked_objects snapshots it to
+                # a frozenset, so no per-tick copy or union is needed
+                if demo_mode and random.random() < 0.1:  # 10% chance to add new object
+                    stream_id = random.getrandbits(1)
+                    new_object_id = 1000 + random.getrandbits(13) % 9000
+                    seen = demo_seen[stream_id]
+                    if new_object_id not in seen:
+                        seen.add(new_object_id)
+                        publisher.update_tracked_objects(stream_id, seen)
             
             # This part is reached when on_disconnect sets publisher.connected to False
             print(f"🔌 MQTT disconnected. Attempting to reconnect in {reconnect_delay} seconds...")
             publisher.stop_publishing()
-            publisher.client.loop_stop()
             time.sleep(reconnect_delay)
+            reconnect_delay = min(reconnect_delay * 2, 30)
 
         except KeyboardInterrupt:
             print("\n🛑 Stopping tracking-based MQTT publisher...")
@@ -435,6 +903,7 @@ def main():
             print(f"❌ An unexpected error occurred in the main loop: {e}")
             print(f"🔁 Retrying in {reconnect_delay} seconds...")
             time.sleep(reconnect_delay)
+            reconnect_delay = min(reconnect_delay * 2, 30)
     
     publisher.disconnect()
 